@@ -1,9 +1,29 @@
 #!/usr/bin/env python3
+from collections import OrderedDict
 
 import build_tor_android
 import build_tor_linux
 import build_tor_windows
+import utils
+from utils import PLATFORMS
 
-build_tor_android.build()
-build_tor_linux.build()
-build_tor_windows.build()
+
+def build():
+    # prepare sources and sources jar only once for all platforms
+    versions, jar_names = utils.setup_all(PLATFORMS)
+
+    build_tor_android.setup_android_ndk(versions)
+
+    utils.run_builds(OrderedDict([
+        ('android', build_tor_android.get_builds(versions)),
+        ('linux', build_tor_linux.get_builds(versions)),
+        ('windows', build_tor_windows.get_builds(versions)),
+    ]))
+
+    build_tor_android.package_android(versions, jar_names['android'])
+    build_tor_linux.package_linux(versions, jar_names['linux'])
+    build_tor_windows.package_windows(versions, jar_names['windows'])
+
+
+if __name__ == "__main__":
+    build()
@@ -1,13 +1,15 @@
 #!/usr/bin/env python3
 import os
+from functools import partial
 from shutil import rmtree, move, copy
-from subprocess import check_call
 
 import utils
-from utils import get_sha256, fail, BUILD_DIR, get_output_dir, reset_time
+from utils import get_sha256, fail, BUILD_DIR, get_output_dir, reset_time, get_log_dir, run
 
 NDK_DIR = 'android-ndk'
+NDK_ZIP = 'android-ndk.zip'
 PLATFORM = "android"
+LOG_DIR = get_log_dir(PLATFORM)
 
 
 def build():
@@ -15,7 +17,7 @@ def build():
 
     setup_android_ndk(versions)
 
-    build_android(versions)
+    utils.run_builds({PLATFORM: get_builds(versions)})
 
     package_android(versions, jar_name)
 
@@ -34,18 +36,23 @@ def setup_android_ndk(versions):
             rmtree(NDK_DIR)
 
     if not os.path.isdir(NDK_DIR):
-        # download Android NDK
-        print("Downloading Android NDK...")
-        check_call(['wget', '-c', '--no-verbose', versions['ndk']['url'], '-O', 'android-ndk.zip'])
+        if utils.get_bundle() is None:
+            # download Android NDK
+            print("Downloading Android NDK...")
+            run(['wget', '-c', '--no-verbose', versions['ndk']['url'], '-O', NDK_ZIP], log_dir=LOG_DIR)
+            ndk_zip = NDK_ZIP
+        else:
+            print("Extracting Android NDK from bundle...")
+            ndk_zip = utils.get_bundle_file(NDK_ZIP)
 
         # check sha256 hash on downloaded file
-        if get_sha256('android-ndk.zip') != versions['ndk']['sha256']:
+        if get_sha256(ndk_zip) != versions['ndk']['sha256']:
             fail("Android NDK checksum does not match")
 
         # install the NDK
         print("Unpacking Android NDK...")
         ndk_dir_tmp = NDK_DIR + '-tmp'
-        check_call(['unzip', '-q', 'android-ndk.zip', '-d', ndk_dir_tmp])
+        run(['unzip', '-q', ndk_zip, '-d', ndk_dir_tmp], log_dir=LOG_DIR)
         content = os.listdir(ndk_dir_tmp)
         if len(content) == 1 and content[0].startswith('android-ndk-r'):
             move(os.path.join(ndk_dir_tmp, content[0]), NDK_DIR)
@@ -56,33 +63,28 @@ def setup_android_ndk(versions):
     os.environ['ANDROID_NDK_HOME'] = os.path.abspath(NDK_DIR)
 
 
-def build_android(versions):
+def get_builds(versions):
     # use default PIE flags, if not present
     os.environ.pop("PIEFLAGS", None)
 
-    # build arm pie
-    env = os.environ.copy()
-    env['APP_ABI'] = "armeabi-v7a"
-    env['NDK_PLATFORM_LEVEL'] = "16"  # first level supporting PIE
-    build_android_arch('tor_arm_pie.zip', env, versions)
-
-    # build arm64 pie
-    env = os.environ.copy()
-    env['APP_ABI'] = "arm64-v8a"
-    env['NDK_PLATFORM_LEVEL'] = "21"  # first level supporting 64-bit
-    build_android_arch('tor_arm64_pie.zip', env, versions)
+    # the Makefile cleans up between Android builds, so only the first one needs a clean tree
+    return [
+        # build arm pie, 16 is the first level supporting PIE
+        (True, partial(build_android_arch, 'tor_arm_pie.zip', get_env("armeabi-v7a", "16"), versions)),
+        # build arm64 pie, 21 is the first level supporting 64-bit
+        (False, partial(build_android_arch, 'tor_arm64_pie.zip', get_env("arm64-v8a", "21"), versions)),
+        # build x86 pie
+        (False, partial(build_android_arch, 'tor_x86_pie.zip', get_env("x86", "16"), versions)),
+        # build x86_64 pie
+        (False, partial(build_android_arch, 'tor_x86_64_pie.zip', get_env("x86_64", "21"), versions)),
+    ]
 
-    # build x86 pie
-    env = os.environ.copy()
-    env['APP_ABI'] = "x86"
-    env['NDK_PLATFORM_LEVEL'] = "16"  # first level supporting PIE
-    build_android_arch('tor_x86_pie.zip', env, versions)
 
-    # build x86_64 pie
+def get_env(abi, platform_level):
     env = os.environ.copy()
-    env['APP_ABI'] = "x86_64"
-    env['NDK_PLATFORM_LEVEL'] = "21"  # first level supporting 64-bit
-    build_android_arch('tor_x86_64_pie.zip', env, versions)
+    env['APP_ABI'] = abi
+    env['NDK_PLATFORM_LEVEL'] = platform_level
+    return env
 
 
 def build_android_arch(name, env, versions):
@@ -91,13 +93,13 @@ def build_android_arch(name, env, versions):
     # TODO add extra flags to configure?
     #  '--enable-static-tor',
     #  '--enable-static-zlib',
-    check_call(['make', 'clean', 'tor'], cwd=BUILD_DIR, env=env)
+    run(['make', 'clean', 'tor'], cwd=BUILD_DIR, env=env, log_dir=LOG_DIR)
     tor_path = os.path.join(output_dir, 'tor')
     # note: stripping happens in makefile for now
     copy(os.path.join(BUILD_DIR, 'tor', 'src', 'app', 'tor'), tor_path)
     reset_time(tor_path, versions)
     print("Sha256 hash of tor before zipping %s: %s" % (name, get_sha256(tor_path)))
-    check_call(['zip', '--no-dir-entries', '--junk-paths', '-X', name, 'tor'], cwd=output_dir)
+    run(['zip', '--no-dir-entries', '--junk-paths', '-X', name, 'tor'], cwd=output_dir, log_dir=LOG_DIR)
     os.remove(tor_path)
 
 
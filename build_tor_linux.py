@@ -1,27 +1,33 @@
 #!/usr/bin/env python3
 import os
+from functools import partial
 from shutil import rmtree, copy
-from subprocess import check_call
 
 import utils
 from utils import BUILD_DIR, get_output_dir, TOR_CONFIGURE_FLAGS, OPENSSL_CONFIGURE_FLAGS, REPRODUCIBLE_GCC_CFLAGS, \
-    XZ_CONFIGURE_FLAGS, reset_time, get_sha256, pack, create_pom_file
+    XZ_CONFIGURE_FLAGS, reset_time, get_sha256, pack, create_pom_file, get_log_dir, run
 
 PLATFORM = "linux"
+LOG_DIR = get_log_dir(PLATFORM)
 
 
 def build():
     versions, jar_name = utils.setup(PLATFORM)
 
-    build_linux(versions)
+    utils.run_builds({PLATFORM: get_builds(versions)})
 
     package_linux(versions, jar_name)
 
 
-def build_linux(versions):
-    build_linux_arch('aarch64', 'armv8-a', 'aarch64-linux-gnu-gcc', 'linux-aarch64', 'aarch64', versions)
-    build_linux_arch('armhf', 'armv7-a', 'arm-linux-gnueabihf-gcc', 'linux-armv4', 'arm-linux-gnueabihf', versions)
-    build_linux_arch('x86_64', 'x86-64', 'x86_64-linux-gnu-gcc', 'linux-x86_64', 'x86_64', versions)
+def get_builds(versions):
+    return [
+        (True, partial(build_linux_arch, 'aarch64', 'armv8-a', 'aarch64-linux-gnu-gcc', 'linux-aarch64',
+                       'aarch64', versions)),
+        (True, partial(build_linux_arch, 'armhf', 'armv7-a', 'arm-linux-gnueabihf-gcc', 'linux-armv4',
+                       'arm-linux-gnueabihf', versions)),
+        (True, partial(build_linux_arch, 'x86_64', 'x86-64', 'x86_64-linux-gnu-gcc', 'linux-x86_64',
+                       'x86_64', versions)),
+    ]
 
 
 def build_linux_arch(arch, gcc_arch, cc_env, openssl_target, autogen_host, versions):
@@ -31,8 +37,7 @@ def build_linux_arch(arch, gcc_arch, cc_env, openssl_target, autogen_host, versi
     lib_dir = os.path.join(prefix_dir, 'lib')
     include_dir = os.path.join(prefix_dir, 'include')
 
-    # ensure clean build environment (again here to protect against build reordering)
-    utils.prepare_repos(versions)
+    # remove static libraries of previous builds, sources get cleaned by utils.run_builds()
     if os.path.exists(prefix_dir):
         rmtree(prefix_dir)
 
@@ -53,74 +58,74 @@ def build_linux_arch(arch, gcc_arch, cc_env, openssl_target, autogen_host, versi
 
     # build lzma
     xz_dir = os.path.join(BUILD_DIR, 'xz')
-    check_call(['./autogen.sh'], cwd=xz_dir)
-    check_call(['./configure',
-                '--prefix=%s' % prefix_dir,
-                '--host=%s' % autogen_host,
-                ] + XZ_CONFIGURE_FLAGS, cwd=xz_dir, env=env)
-    check_call(['make', '-j', str(os.cpu_count()), 'install'], cwd=xz_dir, env=env)
+    run(['./autogen.sh'], cwd=xz_dir, log_dir=LOG_DIR)
+    run(['./configure',
+         '--prefix=%s' % prefix_dir,
+         '--host=%s' % autogen_host,
+         ] + XZ_CONFIGURE_FLAGS, cwd=xz_dir, env=env, log_dir=LOG_DIR)
+    run(['make', '-j', str(os.cpu_count()), 'install'], cwd=xz_dir, env=env, log_dir=LOG_DIR)
 
     # build zstd
     zstd_dir = os.path.join(BUILD_DIR, 'zstd', "lib")
-    check_call(['make', '-j', str(os.cpu_count()), 'DESTDIR=%s' % prefix_dir, 'PREFIX=""', 'install'],
-               cwd=zstd_dir, env=env)
+    run(['make', '-j', str(os.cpu_count()), 'DESTDIR=%s' % prefix_dir, 'PREFIX=""', 'install'],
+        cwd=zstd_dir, env=env, log_dir=LOG_DIR)
 
     # build zlib
     zlib_dir = os.path.join(BUILD_DIR, 'zlib')
-    check_call(['./configure', '--prefix=%s' % prefix_dir], cwd=zlib_dir, env=env)
-    check_call(['make', '-j', str(os.cpu_count()), 'install'], cwd=zlib_dir, env=env)
+    run(['./configure', '--prefix=%s' % prefix_dir], cwd=zlib_dir, env=env, log_dir=LOG_DIR)
+    run(['make', '-j', str(os.cpu_count()), 'install'], cwd=zlib_dir, env=env, log_dir=LOG_DIR)
 
     # build openssl
     openssl_dir = os.path.join(BUILD_DIR, 'openssl')
     extra_flags = []
     if autogen_host.endswith("64"):
         extra_flags = ['enable-ec_nistp_64_gcc_128']
-    check_call(['perl', 'Configure',
-                '--prefix=%s' % prefix_dir,
-                '--openssldir=%s' % prefix_dir,
-                '-march=%s' % gcc_arch,
-                openssl_target,
-                'shared',
-                ] + OPENSSL_CONFIGURE_FLAGS + extra_flags, cwd=openssl_dir, env=env)
-    check_call(['make', '-j', str(os.cpu_count())], cwd=openssl_dir, env=env)
-    check_call(['make', 'install_sw'], cwd=openssl_dir, env=env)
+    run(['perl', 'Configure',
+         '--prefix=%s' % prefix_dir,
+         '--openssldir=%s' % prefix_dir,
+         '-march=%s' % gcc_arch,
+         openssl_target,
+         'shared',
+         ] + OPENSSL_CONFIGURE_FLAGS + extra_flags, cwd=openssl_dir, env=env, log_dir=LOG_DIR)
+    run(['make', '-j', str(os.cpu_count())], cwd=openssl_dir, env=env, log_dir=LOG_DIR)
+    run(['make', 'install_sw'], cwd=openssl_dir, env=env, log_dir=LOG_DIR)
 
     # build libevent
     libevent_dir = os.path.join(BUILD_DIR, 'libevent')
-    check_call(['./autogen.sh'], cwd=libevent_dir)
-    check_call(['./configure', '--disable-shared', '--prefix=%s' % prefix_dir,
-                '--host=%s' % autogen_host], cwd=libevent_dir, env=env)
-    check_call(['make', '-j', str(os.cpu_count())], cwd=libevent_dir, env=env)
-    check_call(['make', 'install'], cwd=libevent_dir, env=env)
+    run(['./autogen.sh'], cwd=libevent_dir, log_dir=LOG_DIR)
+    run(['./configure', '--disable-shared', '--prefix=%s' % prefix_dir,
+         '--host=%s' % autogen_host], cwd=libevent_dir, env=env, log_dir=LOG_DIR)
+    run(['make', '-j', str(os.cpu_count())], cwd=libevent_dir, env=env, log_dir=LOG_DIR)
+    run(['make', 'install'], cwd=libevent_dir, env=env, log_dir=LOG_DIR)
 
     # build Tor
     tor_dir = os.path.join(BUILD_DIR, 'tor')
-    check_call(['./autogen.sh'], cwd=tor_dir)
+    run(['./autogen.sh'], cwd=tor_dir, log_dir=LOG_DIR)
     env['CFLAGS'] += ' -O3'  # needed for FORTIFY_SOURCE
     # TODO check if a completely static Tor is still portable
     #  '--enable-static-tor',
-    check_call(['./configure',
-                '--host=%s' % autogen_host,
-                '--prefix=%s' % prefix_dir,
-                '--enable-lzma',
-                '--enable-zstd',
-                '--enable-static-zlib',
-                '--with-zlib-dir=%s' % prefix_dir,
-                '--enable-static-libevent',
-                '--with-libevent-dir=%s' % prefix_dir,
-                '--enable-static-openssl',
-                '--with-openssl-dir=%s' % prefix_dir,
-                ] + TOR_CONFIGURE_FLAGS, cwd=tor_dir, env=env)
-    check_call(['make', '-j', str(os.cpu_count()), 'install'], cwd=tor_dir, env=env)
+    run(['./configure',
+         '--host=%s' % autogen_host,
+         '--prefix=%s' % prefix_dir,
+         '--enable-lzma',
+         '--enable-zstd',
+         '--enable-static-zlib',
+         '--with-zlib-dir=%s' % prefix_dir,
+         '--enable-static-libevent',
+         '--with-libevent-dir=%s' % prefix_dir,
+         '--enable-static-openssl',
+         '--with-openssl-dir=%s' % prefix_dir,
+         ] + TOR_CONFIGURE_FLAGS, cwd=tor_dir, env=env, log_dir=LOG_DIR)
+    run(['make', '-j', str(os.cpu_count()), 'install'], cwd=tor_dir, env=env, log_dir=LOG_DIR)
 
     # copy and zip built Tor binary
     output_dir = get_output_dir(PLATFORM)
     tor_path = os.path.join(output_dir, 'tor')
     copy(os.path.join(BUILD_DIR, 'tor', 'src', 'app', 'tor'), tor_path)
-    check_call(['strip', '-D', tor_path])
+    run(['strip', '-D', tor_path], log_dir=LOG_DIR)
     reset_time(tor_path, versions)
     print("Sha256 hash of tor before zipping %s: %s" % (name, get_sha256(tor_path)))
-    check_call(['zip', '--no-dir-entries', '--junk-paths', '-X', name, 'tor'], cwd=output_dir)
+    run(['zip', '--no-dir-entries', '--junk-paths', '-X', name, 'tor'], cwd=output_dir, log_dir=LOG_DIR)
     os.remove(tor_path)
 
 
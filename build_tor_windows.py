@@ -1,25 +1,28 @@
 #!/usr/bin/env python3
 import os
+from functools import partial
 from shutil import rmtree, copy
-from subprocess import check_call
 
 import utils
 from utils import BUILD_DIR, get_output_dir, TOR_CONFIGURE_FLAGS, OPENSSL_CONFIGURE_FLAGS, REPRODUCIBLE_GCC_CFLAGS, \
-    XZ_CONFIGURE_FLAGS, reset_time, get_sha256
+    XZ_CONFIGURE_FLAGS, reset_time, get_sha256, get_log_dir, run
 
 PLATFORM = "windows"
+LOG_DIR = get_log_dir(PLATFORM)
 
 
 def build():
     versions, jar_name = utils.setup(PLATFORM)
 
-    build_windows(versions)
+    utils.run_builds({PLATFORM: get_builds(versions)})
 
     package_windows(versions, jar_name)
 
 
-def build_windows(versions):
-    build_windows_arch('x86_64', 'x86_64-w64-mingw32', versions)
+def get_builds(versions):
+    return [
+        (True, partial(build_windows_arch, 'x86_64', 'x86_64-w64-mingw32', versions)),
+    ]
 
 
 def build_windows_arch(arch, host, versions):
@@ -29,8 +32,7 @@ def build_windows_arch(arch, host, versions):
     lib_dir = os.path.join(prefix_dir, 'lib')
     include_dir = os.path.join(prefix_dir, 'include')
 
-    # ensure clean build environment (again here to protect against build reordering)
-    utils.prepare_repos(versions)
+    # remove static libraries of previous builds, sources get cleaned by utils.run_builds()
     if os.path.exists(prefix_dir):
         rmtree(prefix_dir)
 
@@ -49,80 +51,80 @@ def build_windows_arch(arch, host, versions):
 
     # build lzma
     xz_dir = os.path.join(BUILD_DIR, 'xz')
-    check_call(['./autogen.sh'], cwd=xz_dir)
-    check_call(['./configure',
-                '--prefix=%s' % prefix_dir,
-                '--host=%s' % host,
-                ] + XZ_CONFIGURE_FLAGS, cwd=xz_dir, env=env)
-    check_call(['make', '-j', str(os.cpu_count()), 'install'], cwd=xz_dir, env=env)
+    run(['./autogen.sh'], cwd=xz_dir, log_dir=LOG_DIR)
+    run(['./configure',
+         '--prefix=%s' % prefix_dir,
+         '--host=%s' % host,
+         ] + XZ_CONFIGURE_FLAGS, cwd=xz_dir, env=env, log_dir=LOG_DIR)
+    run(['make', '-j', str(os.cpu_count()), 'install'], cwd=xz_dir, env=env, log_dir=LOG_DIR)
 
     # build zlib
     zlib_dir = os.path.join(BUILD_DIR, 'zlib')
-    check_call(['make', '-j', str(os.cpu_count()), '-f', 'win32/Makefile.gcc', 'BINARY_PATH=%s/bin' % prefix_dir,
-                'INCLUDE_PATH=%s/include' % prefix_dir, 'LIBRARY_PATH=%s/lib' % prefix_dir,
-                'SHARED_MODE=1', 'PREFIX=%s-' % host, 'install'],
-               cwd=zlib_dir, env=env)
+    run(['make', '-j', str(os.cpu_count()), '-f', 'win32/Makefile.gcc', 'BINARY_PATH=%s/bin' % prefix_dir,
+         'INCLUDE_PATH=%s/include' % prefix_dir, 'LIBRARY_PATH=%s/lib' % prefix_dir,
+         'SHARED_MODE=1', 'PREFIX=%s-' % host, 'install'],
+        cwd=zlib_dir, env=env, log_dir=LOG_DIR)
 
     # build openssl
     env['LDFLAGS'] = REPRODUCIBLE_GCC_CFLAGS + " -static -static-libgcc -L%s" % prefix_dir
 
     openssl_dir = os.path.join(BUILD_DIR, 'openssl')
-    check_call(['perl', 'Configure',
-                'mingw64',
-                '--cross-compile-prefix=%s-' % host,
-                '--prefix=%s' % prefix_dir,
-                '--openssldir=%s' % prefix_dir,
-                # '-static',  # https://github.com/openssl/openssl/issues/14574
-                '-static-libgcc',
-                'no-shared',
-                'enable-ec_nistp_64_gcc_128',
-                ] + OPENSSL_CONFIGURE_FLAGS, cwd=openssl_dir, env=env)
-    check_call(['make', '-j', str(os.cpu_count())], cwd=openssl_dir, env=env)
-    check_call(['make', 'install_sw'], cwd=openssl_dir, env=env)
+    run(['perl', 'Configure',
+         'mingw64',
+         '--cross-compile-prefix=%s-' % host,
+         '--prefix=%s' % prefix_dir,
+         '--openssldir=%s' % prefix_dir,
+         # '-static',  # https://github.com/openssl/openssl/issues/14574
+         '-static-libgcc',
+         'no-shared',
+         'enable-ec_nistp_64_gcc_128',
+         ] + OPENSSL_CONFIGURE_FLAGS, cwd=openssl_dir, env=env, log_dir=LOG_DIR)
+    run(['make', '-j', str(os.cpu_count())], cwd=openssl_dir, env=env, log_dir=LOG_DIR)
+    run(['make', 'install_sw'], cwd=openssl_dir, env=env, log_dir=LOG_DIR)
 
     # build libevent
     libevent_dir = os.path.join(BUILD_DIR, 'libevent')
-    check_call(['./autogen.sh'], cwd=libevent_dir)
-    check_call(['./configure',
-                '--host=%s' % host,
-                '--disable-libevent-regress',
-                '--disable-samples',
-                '--disable-shared',
-                '--prefix=%s' % prefix_dir,
-                ], cwd=libevent_dir, env=env)
-    check_call(['make', '-j', str(os.cpu_count())], cwd=libevent_dir, env=env)
-    check_call(['make', 'install'], cwd=libevent_dir, env=env)
+    run(['./autogen.sh'], cwd=libevent_dir, log_dir=LOG_DIR)
+    run(['./configure',
+         '--host=%s' % host,
+         '--disable-libevent-regress',
+         '--disable-samples',
+         '--disable-shared',
+         '--prefix=%s' % prefix_dir,
+         ], cwd=libevent_dir, env=env, log_dir=LOG_DIR)
+    run(['make', '-j', str(os.cpu_count())], cwd=libevent_dir, env=env, log_dir=LOG_DIR)
+    run(['make', 'install'], cwd=libevent_dir, env=env, log_dir=LOG_DIR)
 
     # build Tor
     tor_dir = os.path.join(BUILD_DIR, 'tor')
-    check_call(['./autogen.sh'], cwd=tor_dir)
+    run(['./autogen.sh'], cwd=tor_dir, log_dir=LOG_DIR)
     env['CFLAGS'] += ' -O3'
     env['LIBS'] = "-lcrypt32"
 
     # TODO check if a completely static Tor is still portable
     #  '--enable-static-tor',
-    check_call(['./configure',
-                '--host=%s' % host,
-                '--prefix=%s' % prefix_dir,
-                '--enable-lzma',
-                '--enable-static-zlib',
-                '--with-zlib-dir=%s' % prefix_dir,
-                '--enable-static-libevent',
-                '--with-libevent-dir=%s' % prefix_dir,
-                '--enable-static-openssl',
-                '--with-openssl-dir=%s' % prefix_dir,
-                ] + TOR_CONFIGURE_FLAGS, cwd=tor_dir, env=env)
-    check_call(['make', '-j', str(os.cpu_count())], cwd=tor_dir, env=env)
-    check_call(['make', 'install'], cwd=tor_dir, env=env)
+    run(['./configure',
+         '--host=%s' % host,
+         '--prefix=%s' % prefix_dir,
+         '--enable-lzma',
+         '--enable-static-zlib',
+         '--with-zlib-dir=%s' % prefix_dir,
+         '--enable-static-libevent',
+         '--with-libevent-dir=%s' % prefix_dir,
+         '--enable-static-openssl',
+         '--with-openssl-dir=%s' % prefix_dir,
+         ] + TOR_CONFIGURE_FLAGS, cwd=tor_dir, env=env, log_dir=LOG_DIR)
+    run(['make', '-j', str(os.cpu_count())], cwd=tor_dir, env=env, log_dir=LOG_DIR)
+    run(['make', 'install'], cwd=tor_dir, env=env, log_dir=LOG_DIR)
 
     # copy and zip built Tor binary
     output_dir = get_output_dir(PLATFORM)
     tor_path = os.path.join(output_dir, 'tor')
     copy(os.path.join(prefix_dir, 'bin', 'tor.exe'), tor_path)
-    check_call(['strip', '-D', tor_path])
+    run(['strip', '-D', tor_path], log_dir=LOG_DIR)
     reset_time(tor_path, versions)
     print("Sha256 hash of tor before zipping %s: %s" % (name, get_sha256(tor_path)))
-    check_call(['zip', '--no-dir-entries', '--junk-paths', '-X', name, 'tor'], cwd=output_dir)
+    run(['zip', '--no-dir-entries', '--junk-paths', '-X', name, 'tor'], cwd=output_dir, log_dir=LOG_DIR)
     os.remove(tor_path)
 
 
@@ -0,0 +1,119 @@
+#!/usr/bin/env python3
+import io
+import json
+import os
+import tarfile
+from collections import OrderedDict
+from shutil import rmtree
+from subprocess import check_output
+
+import utils
+from build_tor_android import NDK_ZIP
+from utils import BUILD_DIR, REPOS, PLATFORMS, BUNDLE_INDEX, BUNDLE_PINNED_REF, get_sha256, get_build_versions, \
+    get_version, get_version_tag, get_bundle_repo_name, get_submodules, get_log_dir, fail, run
+from verify_tor_utils import get_url, get_reference_bundle_name
+
+BUNDLE_TMP_DIR = 'bundle-tmp'
+LOG_DIR = get_log_dir('bundle')
+
+
+def main():
+    if utils.get_bundle() is not None:
+        fail("Can not export a bundle while %s is set" % utils.BUNDLE_ENV)
+
+    # get Tor version and versions of its dependencies
+    versions = get_build_versions(get_version())
+    print("Exporting bundle for Tor %s" % versions['tor']['commit'])
+
+    for directory in [BUNDLE_TMP_DIR, LOG_DIR]:
+        if os.path.isdir(directory):
+            rmtree(directory)
+    os.makedirs(BUNDLE_TMP_DIR)
+
+    # clone and checkout repos based on tor-versions.json
+    utils.prepare_repos(versions, LOG_DIR)
+    files = []
+    commits = OrderedDict()
+    for repo in REPOS:
+        files += export_repo(os.path.join(BUILD_DIR, repo), commits)
+
+    files.append(export_ndk(versions))
+    for platform in PLATFORMS:
+        files.append(export_reference(versions, platform))
+
+    bundle_name = get_bundle_file_name(versions)
+    write_bundle(versions, commits, sorted(files), bundle_name)
+    rmtree(BUNDLE_TMP_DIR)
+    print("%s: %s" % (bundle_name, get_sha256(bundle_name)))
+
+
+def export_repo(path, commits):
+    # bundle only the checked out commit, so the bundle does not depend on the state of the remote
+    name = get_bundle_repo_name(path)
+    commits[name] = check_output(['git', 'rev-parse', 'HEAD'], cwd=path).decode().strip()
+    bundle_file = os.path.abspath(os.path.join(BUNDLE_TMP_DIR, name))
+    os.makedirs(os.path.dirname(bundle_file), exist_ok=True)
+    run(['git', 'branch', '-f', BUNDLE_PINNED_REF, 'HEAD'], cwd=path, log_dir=LOG_DIR)
+    run(['git', 'bundle', 'create', '-q', bundle_file, BUNDLE_PINNED_REF], cwd=path, log_dir=LOG_DIR)
+    run(['git', 'branch', '-q', '-D', BUNDLE_PINNED_REF], cwd=path, log_dir=LOG_DIR)
+    files = [name]
+    for _, sub_path in get_submodules(path):
+        files += export_repo(os.path.join(path, sub_path), commits)
+    return files
+
+
+def export_ndk(versions):
+    ndk_zip = os.path.join(BUNDLE_TMP_DIR, NDK_ZIP)
+    print("Downloading Android NDK...")
+    run(['wget', '--no-verbose', versions['ndk']['url'], '-O', ndk_zip], log_dir=LOG_DIR)
+    if get_sha256(ndk_zip) != versions['ndk']['sha256']:
+        fail("Android NDK checksum does not match")
+    return NDK_ZIP
+
+
+def export_reference(versions, platform):
+    name = get_reference_bundle_name(versions, platform)
+    ref_file = os.path.join(BUNDLE_TMP_DIR, name)
+    os.makedirs(os.path.dirname(ref_file), exist_ok=True)
+    run(['wget', '--no-verbose', get_url(versions, platform), '-O', ref_file], log_dir=LOG_DIR)
+    return name
+
+
+def write_bundle(versions, commits, files, bundle_name):
+    # the index comes first, so importing can find all other files without reading the whole bundle
+    index = OrderedDict()
+    index['versions'] = versions
+    index['commits'] = commits
+    index['files'] = OrderedDict()
+    for name in files:
+        path = os.path.join(BUNDLE_TMP_DIR, name)
+        index['files'][name] = OrderedDict([('size', os.path.getsize(path)), ('sha256', get_sha256(path))])
+    index_data = json.dumps(index, indent=2).encode() + b'\n'
+
+    # fixed owners, modes and times keep the tar layout independent of the exporting machine,
+    # but git packs depend on the local object store, so bundles are verified by the commits and checksums
+    # in the index and not by their own checksum
+    with tarfile.open(bundle_name, 'w:', format=tarfile.PAX_FORMAT) as tar:
+        tar.addfile(get_tar_info(BUNDLE_INDEX, len(index_data)), io.BytesIO(index_data))
+        for name in files:
+            path = os.path.join(BUNDLE_TMP_DIR, name)
+            with open(path, 'rb') as f:
+                tar.addfile(get_tar_info(name, os.path.getsize(path)), f)
+
+
+def get_tar_info(name, size):
+    info = tarfile.TarInfo(name)
+    info.size = size
+    info.mode = 0o644
+    info.mtime = 0
+    info.uid = info.gid = 0
+    info.uname = info.gname = ''
+    return info
+
+
+def get_bundle_file_name(versions):
+    return os.path.abspath(os.path.join('output', 'tor-%s-bundle.tar' % get_version_tag(versions)))
+
+
+if __name__ == "__main__":
+    main()
@@ -1,14 +1,26 @@
 #!/usr/bin/env python3
 
 import hashlib
+import gzip
 import json
 import os
 import sys
-from collections import OrderedDict
-from shutil import copy, rmtree
-from subprocess import check_call
+import tarfile
+import time
+from collections import OrderedDict, deque
+from shutil import copy, copyfileobj, rmtree
+from subprocess import check_call, check_output, Popen, PIPE, STDOUT, CalledProcessError
 
 BUILD_DIR = 'tor-build'
+REPOS = ['tor', 'libevent', 'openssl', 'xz', 'zlib', 'zstd']
+PLATFORMS = ['android', 'linux', 'windows']
+BUNDLE_ENV = 'TOR_REPRODUCER_BUNDLE'
+BUNDLE_INDEX = 'index.json'
+BUNDLE_CACHE_DIR = 'bundle-cache'
+BUNDLE_PINNED_REF = 'tor-reproducer-pinned'
+LOG_TAIL_LINES = 50
+# options whose value is the next argument, e.g. git -c name=value or make -j 4
+STEP_OPTIONS_WITH_VALUE = ['-c', '-C', '-d', '-j', '-O']
 TOR_CONFIGURE_FLAGS = [
     '--disable-asciidoc',
     '--disable-systemd',
@@ -56,60 +68,240 @@ REPRODUCIBLE_GCC_CFLAGS = '-fno-guess-branch-probability -frandom-seed="0"'
 def get_output_dir(platform):
     return os.path.abspath(os.path.join('output', platform))
 
+
+def get_log_dir(platform):
+    return os.path.join(get_output_dir(platform), 'logs')
+
 def setup(platform):
+    versions, jar_names = setup_all([platform])
+    return versions, jar_names[platform]
+
+
+def setup_all(platforms):
     # get Tor version from command or show usage information
     version = get_version()
 
     # get Tor version and versions of its dependencies
     versions = get_build_versions(version)
     print("Building Tor %s" % versions['tor']['commit'])
+    if get_bundle() is not None:
+        check_bundle_versions(versions)
 
     # remove output from previous build
-    output_dir = get_output_dir(platform)
-    if os.path.isdir(output_dir):
-        rmtree(output_dir)
-    os.makedirs(output_dir)
+    for platform in platforms:
+        output_dir = get_output_dir(platform)
+        if os.path.isdir(output_dir):
+            rmtree(output_dir)
+        os.makedirs(output_dir)
 
     # clone and checkout repos based on tor-versions.json
-    prepare_repos(versions)
-
-    # create sources jar before building
-    jar_name = create_sources_jar(versions, platform)
-
-    return versions, jar_name
-
-
-def prepare_repos(versions):
-    prepare_repo(os.path.join(BUILD_DIR, "tor"), versions['tor']['url'], versions['tor']['commit'])
-    prepare_repo(os.path.join(BUILD_DIR, "libevent"), versions['libevent']['url'], versions['libevent']['commit'])
-    prepare_repo(os.path.join(BUILD_DIR, "openssl"), versions['openssl']['url'], versions['openssl']['commit'])
-    prepare_repo(os.path.join(BUILD_DIR, "xz"), versions['xz']['url'], versions['xz']['commit'])
-    prepare_repo(os.path.join(BUILD_DIR, "zlib"), versions['zlib']['url'], versions['zlib']['commit'])
-    prepare_repo(os.path.join(BUILD_DIR, "zstd"), versions['zstd']['url'], versions['zstd']['commit'])
-
+    prepare_repos(versions, get_log_dir(platforms[0]))
+
+    # create sources jar before building, its content is the same for all platforms
+    jar_names = OrderedDict()
+    jar_names[platforms[0]] = create_sources_jar(versions, platforms[0])
+    for platform in platforms[1:]:
+        jar_names[platform] = get_sources_file_name(versions, platform)
+        link_file(jar_names[platforms[0]], jar_names[platform])
+
+    return versions, jar_names
+
+
+def run_builds(platform_builds):
+    # platform_builds maps platforms to lists of (needs_clean_tree, function) pairs,
+    # the source tree is only cleaned if a previous build left its artifacts in it
+    dirty = False
+    for platform, builds in platform_builds.items():
+        for needs_clean_tree, build in builds:
+            if needs_clean_tree and dirty:
+                clean_repos(get_log_dir(platform))
+            build()
+            dirty = True
+
+
+def run(cmd, log_dir, cwd=None, env=None):
+    # run a build step with its output going to a compressed log file instead of the console,
+    # only the end of the log gets printed if the step fails
+    # the status line starts with the platform, e.g. "linux" for output/linux/logs
+    label = os.path.basename(os.path.dirname(os.path.abspath(log_dir)))
+    os.makedirs(log_dir, exist_ok=True)
+    step = get_step_name(cmd, cwd)
+    log_name = os.path.join(log_dir, '%03d-%s.log.gz' % (len(os.listdir(log_dir)) + 1, step.replace(' ', '-')))
+    tail = deque(maxlen=LOG_TAIL_LINES)
+    start = time.monotonic()
+    with gzip.open(log_name, 'wb') as log:
+        log.write(("$ %s\n" % ' '.join(cmd)).encode())
+        process = Popen(cmd, cwd=cwd, env=env, stdout=PIPE, stderr=STDOUT)
+        for line in process.stdout:
+            log.write(line)
+            tail.append(line)
+        return_code = process.wait()
+    if return_code != 0:
+        print("%s: %s failed with exit code %d, see %s" % (label, step, return_code, log_name), flush=True)
+        for line in tail:
+            sys.stdout.write(line.decode(errors='replace'))
+        sys.stdout.flush()
+        raise CalledProcessError(return_code, cmd)
+    # flush, as the status lines are the only progress shown while the output goes to the logs
+    print("%s: %s (%.1fs)" % (label, step, time.monotonic() - start), flush=True)
+
+
+def get_step_name(cmd, cwd=None):
+    # e.g. "openssl make install_sw" or "tor git submodule update", options and paths are left out
+    words = [os.path.basename(cmd[0])]
+    args = iter(cmd[1:])
+    for arg in args:
+        if len(words) == 5 or '/' in arg or '=' in arg:
+            break
+        if arg.startswith('-'):
+            if arg in STEP_OPTIONS_WITH_VALUE:
+                next(args, None)
+            continue
+        words.append(arg)
+    if cwd is not None:
+        words.insert(0, os.path.basename(os.path.normpath(cwd)))
+    return ' '.join(words)
+
+
+def prepare_repos(versions, log_dir):
+    for repo in REPOS:
+        prepare_repo(os.path.join(BUILD_DIR, repo), versions[repo]['url'], versions[repo]['commit'], log_dir)
+
+
+def prepare_repo(path, url, version, log_dir):
+    if get_bundle() is not None:
+        prepare_repo_from_bundle(path, url, log_dir)
+        return
 
-def prepare_repo(path, url, version):
     if os.path.isdir(path):
+        # point submodules back to their remotes, in case they were imported from a bundle before
+        run(['git', 'submodule', 'sync', '--recursive'], cwd=path, log_dir=log_dir)
         # get latest commits and tags from remote
-        check_call(['git', 'fetch', '--recurse-submodules=yes', 'origin'], cwd=path)
+        run(['git', 'fetch', '--recurse-submodules=yes', 'origin'], cwd=path, log_dir=log_dir)
     else:
         # clone repo
-        check_call(['git', 'clone', url, path])
+        run(['git', 'clone', url, path], log_dir=log_dir)
 
     # checkout given version
-    check_call(['git', 'checkout', '-f', version], cwd=path)
+    run(['git', 'checkout', '-f', version], cwd=path, log_dir=log_dir)
 
     # initialize and/or update submodules
     # (after checkout, because submodules can point to non-existent commits on master)
-    check_call(['git', 'submodule', 'update', '--init', '--recursive', '-f'], cwd=path)
+    run(['git', 'submodule', 'update', '--init', '--recursive', '-f'], cwd=path, log_dir=log_dir)
 
+    clean_repo(path, log_dir)
+
+
+def prepare_repo_from_bundle(path, url, log_dir):
+    if not os.path.isdir(path):
+        run(['git', 'init', '-q', path], log_dir=log_dir)
+        # keep the remote, so the repo can be used without a bundle later
+        run(['git', 'remote', 'add', 'origin', url], cwd=path, log_dir=log_dir)
+
+    # fetch pinned commit from the bundle and check it out
+    run(['git', 'fetch', '-q', os.path.abspath(get_bundle_repo(path)), BUNDLE_PINNED_REF], cwd=path, log_dir=log_dir)
+    commit = check_output(['git', 'rev-parse', 'FETCH_HEAD'], cwd=path).decode().strip()
+    if commit != get_bundle_index()['commits'][get_bundle_repo_name(path)]:
+        fail("Bundle %s contains unexpected commit %s for %s" % (get_bundle(), commit, path))
+    run(['git', 'checkout', '-f', 'FETCH_HEAD'], cwd=path, log_dir=log_dir)
+
+    # point submodules to their bundles before initializing them
+    prepare_submodules_from_bundle(path, log_dir)
+
+    clean_repo(path, log_dir)
+
+
+def clean_repos(log_dir):
+    for repo in REPOS:
+        clean_repo(os.path.join(BUILD_DIR, repo), log_dir)
+
+
+def clean_repo(path, log_dir):
     # undo all changes
-    check_call(['git', 'reset', '--hard'], cwd=path)
-    check_call(['git', 'submodule', 'foreach', 'git', 'reset', '--hard'], cwd=path)
+    run(['git', 'reset', '--hard'], cwd=path, log_dir=log_dir)
+    run(['git', 'submodule', 'foreach', 'git', 'reset', '--hard'], cwd=path, log_dir=log_dir)
 
     # clean all untracked files and directories (-d) from repo
-    check_call(['git', 'clean', '-dffx'], cwd=path)
-    check_call(['git', 'submodule', 'foreach', 'git', 'clean', '-dffx'], cwd=path)
+    run(['git', 'clean', '-dffx'], cwd=path, log_dir=log_dir)
+    run(['git', 'submodule', 'foreach', 'git', 'clean', '-dffx'], cwd=path, log_dir=log_dir)
+
+
+def prepare_submodules_from_bundle(path, log_dir):
+    run(['git', 'submodule', 'init'], cwd=path, log_dir=log_dir)
+    for name, sub_path in get_submodules(path):
+        bundle_file = os.path.abspath(get_bundle_repo(os.path.join(path, sub_path)))
+        run(['git', 'config', 'submodule.%s.url' % name, bundle_file], cwd=path, log_dir=log_dir)
+    # git treats bundle files like local repositories which are not allowed for submodules by default
+    run(['git', '-c', 'protocol.file.allow=always', 'submodule', 'update', '-f'], cwd=path, log_dir=log_dir)
+    for name, sub_path in get_submodules(path):
+        prepare_submodules_from_bundle(os.path.join(path, sub_path), log_dir)
+
+
+def get_submodules(path):
+    # returns (name, path) pairs of all direct submodules
+    if not os.path.isfile(os.path.join(path, '.gitmodules')):
+        return []
+    config = check_output(['git', 'config', '-f', '.gitmodules', '--get-regexp', r'^submodule\..*\.path$'], cwd=path)
+    submodules = []
+    for line in config.decode().splitlines():
+        key, sub_path = line.split(' ', 1)
+        submodules.append((key[len('submodule.'):-len('.path')], sub_path))
+    return submodules
+
+
+def get_bundle():
+    return os.environ.get(BUNDLE_ENV) or None
+
+
+def get_bundle_repo_name(path):
+    return 'git/%s.bundle' % os.path.relpath(path, BUILD_DIR)
+
+
+def get_bundle_repo(path):
+    return get_bundle_file(get_bundle_repo_name(path))
+
+
+_bundle_index = None
+
+
+def get_bundle_index():
+    global _bundle_index
+    if _bundle_index is None:
+        with tarfile.open(get_bundle(), 'r:') as tar:
+            member = tar.next()
+            if member is None or member.name != BUNDLE_INDEX:
+                fail("%s is not a source bundle" % get_bundle())
+            _bundle_index = json.load(tar.extractfile(member), object_pairs_hook=OrderedDict)
+    return _bundle_index
+
+
+def check_bundle_versions(versions):
+    bundle_versions = get_bundle_index()['versions']
+    tag = bundle_versions['tag']
+    if tag != get_version_tag(versions):
+        fail("Bundle %s was exported for Tor %s, not %s" % (get_bundle(), tag, get_version_tag(versions)))
+    # compare without key order, the same entry of an older tor-versions.json may pin other sources
+    if json.loads(json.dumps(bundle_versions)) != json.loads(json.dumps(versions)):
+        fail("Bundle %s was exported for a different entry of Tor %s in tor-versions.json" % (get_bundle(), tag))
+
+
+def get_bundle_file(name):
+    # extract a single file from the bundle into the cache, unless it is there already
+    index = get_bundle_index()
+    if name not in index['files']:
+        fail("Bundle %s does not contain %s" % (get_bundle(), name))
+    sha256 = index['files'][name]['sha256']
+    path = os.path.join(BUNDLE_CACHE_DIR, name)
+    if os.path.isfile(path) and get_sha256(path) == sha256:
+        return path
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with tarfile.open(get_bundle(), 'r:') as tar:
+        with tar.extractfile(name) as infile:
+            with open(path, 'wb') as outfile:
+                copyfileobj(infile, outfile)
+    if get_sha256(path) != sha256:
+        fail("Checksum of %s in bundle %s does not match" % (name, get_bundle()))
+    return path
 
 
 def get_version():
@@ -172,7 +364,7 @@ def pack(versions, file_list, platform):
     for filename in file_list:
         reset_time(filename, versions)
     zip_name = get_final_file_name(versions, platform)
-    check_call(['zip', '--no-dir-entries', '--junk-paths', '-X', zip_name] + file_list)
+    run(['zip', '--no-dir-entries', '--junk-paths', '-X', zip_name] + file_list, log_dir=get_log_dir(platform))
     return zip_name
 
 
@@ -195,13 +387,21 @@ def create_sources_jar(versions, platform):
     rel_paths = [os.path.relpath(f, BUILD_DIR) for f in sorted(jar_files)]
     # create jar archive with first files
     jar_step = 5000
-    check_call(['jar', 'cf', jar_path] + rel_paths[0:jar_step], cwd=BUILD_DIR)
+    run(['jar', 'cf', jar_path] + rel_paths[0:jar_step], cwd=BUILD_DIR, log_dir=get_log_dir(platform))
     # add subsequent files in steps, because the command line can't handle all at once
     for i in range(jar_step, len(rel_paths), jar_step):
-        check_call(['jar', 'uf', jar_path] + rel_paths[i:i + jar_step], cwd=BUILD_DIR)
+        run(['jar', 'uf', jar_path] + rel_paths[i:i + jar_step], cwd=BUILD_DIR, log_dir=get_log_dir(platform))
     return jar_name
 
 
+def link_file(source, target):
+    # hard link identical files instead of writing them again
+    try:
+        os.link(source, target)
+    except OSError:
+        copy(source, target)
+
+
 def create_pom_file(versions, platform):
     version = get_version_tag(versions)
     pom_name = get_pom_file_name(versions, platform)
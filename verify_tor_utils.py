@@ -1,9 +1,11 @@
 #!/usr/bin/env python3
 import os
 import sys
+from shutil import copy
 from subprocess import check_call
 
-from utils import get_sha256, get_build_versions, get_final_file_name, get_version_tag, get_version
+from utils import get_sha256, get_build_versions, get_final_file_name, get_version_tag, get_version, get_bundle, \
+    get_bundle_file, check_bundle_versions
 
 REF_DIR = "reference"
 
@@ -26,8 +28,12 @@ def verify(version, platform):
     os.makedirs(REF_DIR, exist_ok=True)
     file_name = get_final_file_name(versions, platform)
     ref_file = os.path.join(REF_DIR, file_name)
-    # try downloading from maven central
-    check_call(['wget', '--no-verbose', get_url(versions, platform), '-O', ref_file])
+    if get_bundle() is None:
+        # try downloading from maven central
+        check_call(['wget', '--no-verbose', get_url(versions, platform), '-O', ref_file])
+    else:
+        check_bundle_versions(versions)
+        copy(get_bundle_file(get_reference_bundle_name(versions, platform)), ref_file)
 
     # check if Tor was already build
     if not os.path.isfile(file_name):
@@ -64,3 +70,7 @@ def get_url(versions, platform):
     directory = "tor-%s" % platform
     file = os.path.basename(get_final_file_name(versions, platform))
     return "https://repo.maven.apache.org/maven2/org/briarproject/%s/%s/%s" % (directory, version, file)
+
+
+def get_reference_bundle_name(versions, platform):
+    return "%s/%s/%s" % (REF_DIR, platform, os.path.basename(get_final_file_name(versions, platform)))